@@ -1,21 +1,33 @@
+import gzip
 import json
+import orjson  # stdlib json 대비 2~3배 빠른 파서/직렬화기 (Bedrock 응답 등 핫패스용)
 import boto3
-import io
+from botocore.config import Config
 import os
+import sys
 import base64
 import re
-from pypdf import PdfReader
+import fitz  # PyMuPDF (C 기반 PDF 파서, pypdf 대비 수십 배 빠름)
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime 
 
 # 로깅 설정
 logger = logging.getLogger()
 logger.setLevel(logging.INFO) # INFO 레벨로 설정하여 상세 로그를 볼 수 있습니다.
 
+# 커넥션 풀 확대(병렬 업로드/레코드 처리 대응) + adaptive 재시도 + keepalive
+_BOTO_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+    tcp_keepalive=True
+)
+
 # AWS 서비스 클라이언트 초기화 (전역으로 한 번만 초기화)
-s3_client = boto3.client('s3')
-dynamodb_resource = boto3.resource('dynamodb') # Resource 객체로 변경 (테이블 객체 얻기 위함)
-bedrock_runtime_client = boto3.client('bedrock-runtime') # 클라이언트 이름 변경
+s3_client = boto3.client('s3', config=_BOTO_CONFIG)
+dynamodb_resource = boto3.resource('dynamodb', config=_BOTO_CONFIG) # Resource 객체로 변경 (테이블 객체 얻기 위함)
+bedrock_runtime_client = boto3.client('bedrock-runtime', config=_BOTO_CONFIG) # 클라이언트 이름 변경
 
 # --- 설정값 (당신의 실제 AWS 리소스 이름으로 변경해야 합니다!) ---
 BOOK_META_TABLE_NAME = 'BookMetaDataTable'
@@ -25,39 +37,117 @@ BEDROCK_MODEL_ID = "us.anthropic.claude-sonnet-4-20250514-v1:0"
 # DynamoDB 테이블 객체 초기화 (전역으로 한 번만 초기화)
 book_meta_table = dynamodb_resource.Table(BOOK_META_TABLE_NAME)
 
+# 콜드 스타트 단축: fitz C 확장의 지연 초기화를 요청 경로 밖(import 시점)에서 미리 수행
+fitz.open().close()
+
 # Bedrock 토큰 제한 (사용하는 모델에 따라 조절)
-MAX_BEDROCK_INPUT_LENGTH = 100000 
+MAX_BEDROCK_INPUT_LENGTH = 100000
 MAX_BEDROCK_OUTPUT_TOKENS = 3000
 
+# S3에서 다운로드할 수 있는 최대 파일 크기 (Bedrock 비용 발생 전에 차단)
+MAX_DOWNLOAD_BYTES = 50 * 1024 * 1024  # 50MB
+DOWNLOAD_CHUNK_SIZE = 65536
+
+# 추출 텍스트가 이보다 짧으면 분석할 내용이 없다고 판단 (이미지 전용 PDF 등)
+MIN_EXTRACTED_TEXT_LENGTH = 200
+
+# DynamoDB 항목 크기 예산 (하드 한도 400KB보다 여유를 둠 — 초과 시 put이 통째로 실패)
+DYNAMODB_ITEM_SIZE_BUDGET = 380_000
+
+def _read_body_with_limit(body, max_bytes=MAX_DOWNLOAD_BYTES):
+    """
+    S3 StreamingBody를 청크 단위로 읽어 바이트로 모읍니다.
+    max_bytes를 초과하면 즉시 ValueError를 발생시켜 메모리 폭주를 방지합니다.
+    """
+    buf = bytearray()
+    for chunk in body.iter_chunks(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        buf.extend(chunk)
+        if len(buf) > max_bytes:
+            raise ValueError(f"File exceeds maximum allowed size of {max_bytes} bytes.")
+    return bytes(buf)
+
+def _page_text(page):
+    """
+    한 페이지의 텍스트를 추출합니다. 콘텐츠 스트림이 없는 페이지(빈 간지 등)는
+    파싱 비용 없이 건너뛰고, 손상된 페이지는 전체 추출을 중단하는 대신 비워 둡니다.
+    """
+    try:
+        if not page.get_contents():
+            return ""
+        return page.get_text("text")
+    except Exception as e:
+        logger.warning(f"Skipping unparsable PDF page {page.number}: {e}")
+        return ""
+
+def _extract_pdf_text(pdf_bytes):
+    """
+    PDF 바이트에서 텍스트를 추출합니다. 페이지 구간을 vCPU 수만큼 나누어
+    스레드별로 병렬 처리합니다. (fitz Document 객체는 스레드 안전하지 않으므로
+    스레드마다 별도의 Document를 엽니다. 추출 자체는 GIL을 해제하는 C 코드입니다.)
+    """
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        page_count = doc.page_count
+        if page_count == 0:
+            return ""
+        workers = min(os.cpu_count() or 1, page_count)
+        if workers <= 1:
+            return "".join(_page_text(page) for page in doc)
+    finally:
+        doc.close()
+
+    def _extract_range(page_range):
+        start, stop = page_range
+        range_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        try:
+            return "".join(_page_text(range_doc[i]) for i in range(start, stop))
+        finally:
+            range_doc.close()
+
+    # 페이지를 워커 수만큼 연속 구간으로 분할 (순서 유지를 위해 map 사용)
+    chunk = -(-page_count // workers)  # 올림 나눗셈
+    ranges = [(i, min(i + chunk, page_count)) for i in range(0, page_count, chunk)]
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        parts = list(ex.map(_extract_range, ranges))
+    return "".join(parts)
+
+def _extract_txt_text(file_content_bytes):
+    return file_content_bytes.decode('utf-8')
+
+# 확장자별 추출기 디스패치 테이블 (새 형식 추가 시 여기에만 등록)
+_EXTRACTORS = {
+    'txt': _extract_txt_text,
+    'pdf': _extract_pdf_text,
+}
+
 def download_and_extract_text_from_s3(bucket_name, key):
     """
     S3에서 파일을 다운로드하고, 파일 형식에 따라 텍스트를 추출합니다.
-    (PDF: pypdf, TXT: 디코딩)
+    (PDF: PyMuPDF, TXT: 디코딩)
     """
     logger.info(f"Attempting to download and extract text from s3://{bucket_name}/{key}")
     try:
-        obj = s3_client.get_object(Bucket=bucket_name, Key=key)
-        file_ext = key.lower().split('.')[-1]
-        
-        file_content_bytes = obj['Body'].read()
-
-        if file_ext == 'txt':
-            text = file_content_bytes.decode('utf-8')
-            logger.info(f"Successfully extracted text from TXT file: {key}")
-            return text
-
-        elif file_ext == 'pdf':
-            reader = PdfReader(io.BytesIO(file_content_bytes))
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or "" # None 반환 방지
-            logger.info(f"Successfully extracted text from PDF file: {key}")
-            return text
-
-        else:
+        file_ext = os.path.splitext(key)[1].lower().lstrip('.')
+        extractor = _EXTRACTORS.get(file_ext)
+        if extractor is None:
+            # 지원하지 않는 형식은 다운로드 전에 차단
             logger.error(f"Unsupported file type for {key}. Only PDF and TXT are supported.")
             raise ValueError(f"Unsupported file type: {file_ext}. (pdf, txt만 지원)")
 
+        obj = s3_client.get_object(Bucket=bucket_name, Key=key)
+
+        # ContentLength로 선검사 후, 스트리밍으로 읽으며 상한을 한 번 더 강제합니다.
+        content_length = obj.get('ContentLength')
+        if content_length is not None and content_length > MAX_DOWNLOAD_BYTES:
+            raise ValueError(
+                f"File too large ({content_length} bytes). Maximum allowed is {MAX_DOWNLOAD_BYTES} bytes."
+            )
+        file_content_bytes = _read_body_with_limit(obj['Body'])
+
+        text = extractor(file_content_bytes)
+        logger.info(f"Successfully extracted text from {file_ext.upper()} file: {key}")
+        return text
+
     except s3_client.exceptions.NoSuchKey:
         logger.error(f"File not found in S3: s3://{bucket_name}/{key}")
         raise FileNotFoundError(f"File not found: s3://{bucket_name}/{key}")
@@ -65,12 +155,42 @@ def download_and_extract_text_from_s3(bucket_name, key):
         logger.error(f"Error downloading or extracting text from {key}: {e}", exc_info=True)
         raise
 
-def analyze_book_with_bedrock(extracted_text, book_id):
+# 책 텍스트 정리용 정규식 (모듈 로드 시 1회 컴파일)
+_INLINE_WS_RE = re.compile(r'[ \t\f\v]+')
+_PAGE_NUMBER_LINE_RE = re.compile(r'^\d+$')
+
+def compress_book_text(text):
     """
-    Bedrock Messages API를 사용하여 추출된 텍스트를 분석하고 구조화된 JSON을 반환합니다.
+    Bedrock에 보내기 전에 추출 텍스트의 노이즈를 제거하여 입력 토큰을 줄입니다.
+    - 줄 내부의 연속 공백을 한 칸으로 축소
+    - 페이지 번호만 있는 줄 제거
+    - 연속 중복 줄(반복되는 머리글/바닥글) 접기
+    - 연속 빈 줄을 한 줄로 축소
+    """
+    lines = []
+    prev_line = None
+    for line in text.splitlines():
+        line = _INLINE_WS_RE.sub(' ', line).strip()
+        if not line:
+            # 연속 빈 줄은 문단 구분 1줄만 유지
+            if prev_line == '':
+                continue
+            prev_line = ''
+            lines.append('')
+            continue
+        if _PAGE_NUMBER_LINE_RE.match(line):
+            continue
+        if line == prev_line:
+            continue
+        prev_line = line
+        lines.append(line)
+    return '\n'.join(lines)
+
+def _build_bedrock_body_template():
+    """
+    Bedrock 요청 본문의 정적 부분(프롬프트 템플릿 포함)을 직렬화합니다.
+    모듈 로드 시 1회만 실행되며, 호출 시에는 추출 텍스트만 끼워 넣습니다.
     """
-    logger.info(f"Sending text for Bedrock analysis using Messages API for book ID: {book_id}")
-
     # Messages API 형식에 맞는 요청 본문 (body) 구성
     # system, messages 필드가 필수로 들어갑니다.
     messages_api_body = {
@@ -154,35 +274,70 @@ Here is the data schema you must adhere to for your output:
 11. The total maximum token limit for your response (including the JSON structure and content) is 3000 tokens. Be concise but thorough.
 
 Book Text to analyze:
-<text_to_analyze>{extracted_text}</text_to_analyze>
+<text_to_analyze>__EXTRACTED_TEXT__</text_to_analyze>
 """
                     }
                 ]
             }
         ]
     }
+    return orjson.dumps(messages_api_body)
+
+# __EXTRACTED_TEXT__ 자리표시자를 기준으로 본문을 prefix/suffix 바이트로 분리
+# (매 호출마다 ~3KB 템플릿을 다시 직렬화하지 않기 위함)
+_BEDROCK_BODY_PREFIX, _BEDROCK_BODY_SUFFIX = \
+    _build_bedrock_body_template().split(b"__EXTRACTED_TEXT__")
+
+def analyze_book_with_bedrock(extracted_text, book_id):
+    """
+    Bedrock Messages API를 사용하여 추출된 텍스트를 분석하고 구조화된 JSON을 반환합니다.
+    """
+    logger.info(f"Sending text for Bedrock analysis using Messages API for book ID: {book_id}")
+
+    # 입력 길이 상한 강제: 프롬프트가 프롤로그와 결말을 모두 요구하므로
+    # 초과분은 앞부분+뒷부분을 남기고 중간을 잘라냅니다. (토큰 비용/지연 상한 보장)
+    if len(extracted_text) > MAX_BEDROCK_INPUT_LENGTH:
+        logger.warning(
+            f"Extracted text for {book_id} is {len(extracted_text)} chars; "
+            f"truncating to {MAX_BEDROCK_INPUT_LENGTH} chars (head+tail)."
+        )
+        half = MAX_BEDROCK_INPUT_LENGTH // 2
+        extracted_text = (
+            extracted_text[:half] + "\n...[truncated]...\n" + extracted_text[-half:]
+        )
+
+    # 본문 조립: 정적 템플릿은 import 시 직렬화되어 있으므로,
+    # 추출 텍스트만 JSON 이스케이프하여 끼워 넣습니다.
+    request_body = (
+        _BEDROCK_BODY_PREFIX
+        + orjson.dumps(extracted_text)[1:-1]  # 양끝 따옴표를 제거한 JSON 이스케이프 문자열
+        + _BEDROCK_BODY_SUFFIX
+    )
 
     try:
-        # invoke_model API는 동일하지만, body의 형식이 완전히 변경됩니다.
-        bedrock_response = bedrock_runtime_client.invoke_model(
-            body=json.dumps(messages_api_body), # 새로운 body 사용
+        # 스트리밍 API 사용: 전체 응답 생성이 끝날 때까지 버퍼링하지 않고
+        # 생성되는 대로 청크를 받아 누적합니다. (TTFB 개선, 응답 전체 버퍼링 제거)
+        bedrock_response = bedrock_runtime_client.invoke_model_with_response_stream(
+            body=request_body, # boto3는 bytes body를 그대로 수용
             modelId=BEDROCK_MODEL_ID, # BEDROCK_MODEL_ID는 동일
             contentType="application/json",
             accept="application/json"
         )
-        
-        response_body = json.loads(bedrock_response['body'].read())
-        
-        # Messages API 응답 형식에서 AI 텍스트 추출 방식 변경
-        ai_analysis_raw_text = ""
-        for content_block in response_body.get('content', []):
-            if content_block.get('type') == 'text':
-                ai_analysis_raw_text += content_block.get('text', '')
+
+        # Messages API 스트림 이벤트에서 텍스트 델타만 수집 (join으로 선형 시간 보장)
+        text_parts = []
+        for event in bedrock_response['body']:
+            chunk = orjson.loads(event['chunk']['bytes'])
+            if chunk.get('type') == 'content_block_delta':
+                delta = chunk.get('delta', {})
+                if delta.get('type') == 'text_delta':
+                    text_parts.append(delta.get('text', ''))
+        ai_analysis_raw_text = "".join(text_parts)
 
         logger.info(f"Received raw AI analysis response for {book_id}: {ai_analysis_raw_text[:500]}...")
 
-        # AI 응답 파싱
-        book_analysis_data = json.loads(ai_analysis_raw_text)
+        # AI 응답 파싱 (orjson.JSONDecodeError는 json.JSONDecodeError의 서브클래스)
+        book_analysis_data = orjson.loads(ai_analysis_raw_text)
         logger.info(f"AI response parsed as JSON successfully for book ID: {book_id}.")
         return book_analysis_data
 
@@ -206,10 +361,12 @@ def save_metadata_to_dynamodb(
     book_id,
     analysis_data,
     original_s3_key,
-    processed_s3_key
+    processed_s3_key,
+    writer=None
 ):
     """
     분석된 책 메타데이터를 DynamoDB 테이블에 저장합니다.
+    writer로 batch_writer를 전달하면 여러 레코드의 put을 BatchWriteItem으로 묶습니다.
     """
     logger.info(f"Saving metadata to DynamoDB for bookId: {book_id}")
     
@@ -237,7 +394,21 @@ def save_metadata_to_dynamodb(
         'status': 'PROCESSED',
         'lastProcessedDate': int(datetime.datetime.now().timestamp() * 1000) # 현재 시간 기록
     }
-    book_meta_table.put_item(Item=item_to_put)
+    # 빈 속성은 저장하지 않습니다. (항목 크기가 곧 WCU이므로 최소 속성만 기록)
+    item_to_put = {k: v for k, v in item_to_put.items() if v not in ('', [], None)}
+
+    # 400KB 항목 한도를 조용히 넘겨 put 전체가 실패하기 전에 감지하고,
+    # 가장 큰 속성부터 잘라내어 예산 안으로 맞춥니다.
+    if len(orjson.dumps(item_to_put, default=str)) > DYNAMODB_ITEM_SIZE_BUDGET:
+        logger.warning(
+            f"Metadata item for {book_id} exceeds {DYNAMODB_ITEM_SIZE_BUDGET} bytes; "
+            "dropping keyEvents to fit the DynamoDB item limit."
+        )
+        item_to_put.pop('keyEvents', None)
+        if len(orjson.dumps(item_to_put, default=str)) > DYNAMODB_ITEM_SIZE_BUDGET:
+            item_to_put['bookOverview'] = item_to_put.get('bookOverview', '')[:10000]
+
+    (writer or book_meta_table).put_item(Item=item_to_put)
     logger.info(f"Book metadata saved successfully for {book_id}.")
 
 def save_processed_text_to_s3(
@@ -246,14 +417,17 @@ def save_processed_text_to_s3(
     text_content
 ):
     """
-    추출된 텍스트를 지정된 S3 버킷에 저장합니다.
+    추출된 텍스트를 GZIP으로 압축해 지정된 S3 버킷에 저장합니다.
+    (텍스트는 3~5배 압축되므로 PUT 시간과 저장 비용이 비례해서 줄어듭니다.)
     """
     logger.info(f"Saving extracted text to s3://{bucket_name}/{output_key}")
     try:
         s3_client.put_object(
             Bucket=bucket_name,
             Key=output_key,
-            Body=text_content.encode('utf-8')
+            Body=gzip.compress(text_content.encode('utf-8'), compresslevel=6),
+            ContentEncoding='gzip',
+            ContentType='text/plain; charset=utf-8'
         )
         logger.info(f"Extracted text saved to s3://{bucket_name}/{output_key} successfully.")
     except Exception as e:
@@ -263,16 +437,24 @@ def save_processed_text_to_s3(
 def handle_processing_error(book_id, file_key, error_message):
     """
     파일 처리 중 오류 발생 시 DynamoDB에 FAILED 상태를 기록합니다.
+    UpdateItem을 사용하므로 기존에 성공 저장된 항목이 있어도 통째로 덮어쓰지 않고
+    상태 관련 속성만 갱신합니다. (전체 put 대비 쓰기 용량도 절약)
     """
-    logger.error(f"Error encountered for book ID {book_id} (file: {file_key}): {error_message}", exc_info=True)
-    
-    book_meta_table.put_item(
-        Item={
-            'bookId': book_id,
-            'status': 'FAILED',
-            'errorMessage': error_message,
-            'originalS3Key': file_key,
-            'lastProcessedDate': int(datetime.datetime.now().timestamp() * 1000)
+    # 예외 컨텍스트 밖에서도 호출되므로(예: 추출 텍스트 부족) 활성 예외가 있을 때만 traceback 첨부
+    logger.error(
+        f"Error encountered for book ID {book_id} (file: {file_key}): {error_message}",
+        exc_info=sys.exc_info()[0] is not None
+    )
+
+    book_meta_table.update_item(
+        Key={'bookId': book_id},
+        UpdateExpression='SET #s = :s, errorMessage = :e, originalS3Key = :k, lastProcessedDate = :t',
+        ExpressionAttributeNames={'#s': 'status'},  # status는 DynamoDB 예약어
+        ExpressionAttributeValues={
+            ':s': 'FAILED',
+            ':e': error_message,
+            ':k': file_key,
+            ':t': int(datetime.datetime.now().timestamp() * 1000)
         }
     )
     logger.info(f"Error status 'FAILED' recorded for bookId: {book_id}")
@@ -291,34 +473,49 @@ def generate_images_from_prompt(prompt_text, samples=1):
         modelId="stability.stable-diffusion-xl-v1",
         contentType="application/json",
         accept="application/json",
-        body=json.dumps(payload)
+        body=orjson.dumps(payload)
     )
 
-    result = json.loads(response['body'].read())
-    images = []
+    result = orjson.loads(response['body'].read())
 
-    for i, artifact in enumerate(result.get("artifacts", [])):
+    # 디코딩된 이미지 전체를 리스트로 모으지 않고 하나씩 yield합니다.
+    # (save_images_and_tags_to_s3가 디코딩 즉시 업로드 → 피크 메모리 절반)
+    for artifact in result.get("artifacts", []):
         image_b64 = artifact.get("base64")
         if image_b64:
-            image_bytes = base64.b64decode(image_b64)
-            images.append(image_bytes)
+            yield base64.b64decode(image_b64)
 
-    return images
+# 태그 추출용 단어 패턴 (모듈 로드 시 1회 컴파일)
+_WORD_RE = re.compile(r'\b[a-zA-Z]{3,}\b')
 
 def extract_tags_from_prompt(prompt):
-    return list(set(re.findall(r'\b[a-zA-Z]{3,}\b', prompt.lower())))
+    # finditer로 매치를 스트리밍하고 set comprehension으로 바로 중복 제거
+    # (prompt 전체 lower() 복사본과 중간 리스트 할당을 피함)
+    return list({m.group(0).lower() for m in _WORD_RE.finditer(prompt)})
 
 def save_images_and_tags_to_s3(images, tags, s3_prefix, episode_id):
-    for idx, image_bytes in enumerate(images):
+    def _put_image(idx, image_bytes):
         image_key = f"{s3_prefix}/episode_{episode_id}/image_{idx + 1}.png"
         s3_client.put_object(Bucket=PROCESSED_TEXT_BUCKET_NAME, Key=image_key, Body=image_bytes)
 
+    # 직렬 PUT은 RTT 합산이 지배적 — 병렬 업로드로 max(RTT) 수준으로 단축
+    # (boto3 S3 클라이언트의 put_object는 스레드 안전)
+    # images는 제너레이터도 허용: 디코딩되는 즉시 업로드를 제출해 전체 버퍼링을 피함
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        upload_futures = [
+            executor.submit(_put_image, idx, image_bytes)
+            for idx, image_bytes in enumerate(images)
+        ]
+        for future in upload_futures:
+            future.result()
+
     tag_key = f"{s3_prefix}/episode_{episode_id}/tags.json"
     s3_client.put_object(
         Bucket=PROCESSED_TEXT_BUCKET_NAME,
         Key=tag_key,
-        Body=json.dumps({"tags": tags}).encode("utf-8"),
-        ContentType="application/json"
+        Body=gzip.compress(orjson.dumps({"tags": tags})),
+        ContentType="application/json",
+        ContentEncoding="gzip"
     )
 
 
@@ -331,51 +528,96 @@ def lambda_handler(event, context):
 
     # 모든 레코드를 성공적으로 처리했는지 여부를 추적 (부분 성공 가능)
     overall_status = {'statusCode': 200, 'body': 'Processing initiated for all records. Check logs for details.'}
-
-    for record in event['Records']:
-        source_bucket_name = record['s3']['bucket']['name']
-        file_key = record['s3']['object']['key']
-        book_id = os.path.splitext(os.path.basename(file_key))[0] # 예: raw/my_book.pdf -> my_book
-        
-        logger.info(f"--- Starting processing for book ID: {book_id} (File: {file_key}) ---")
-
-        try:
-            # 1. S3에서 파일 내용 다운로드 및 텍스트 추출
-            extracted_text = download_and_extract_text_from_s3(source_bucket_name, file_key)
-            
-            # 2. Bedrock으로 텍스트 분석
-            book_analysis_data = analyze_book_with_bedrock(extracted_text, book_id) 
-            
-            # 3. DynamoDB에 메타데이터 저장
-            processed_s3_key = f"processed_texts/{book_id}.txt"
-            save_metadata_to_dynamodb(
-                book_id,
-                book_analysis_data,
-                file_key,
-                processed_s3_key
-            )
-
-            # 4. 추출된 전체 텍스트를 다른 S3 버킷에 저장
-            save_processed_text_to_s3(
-                PROCESSED_TEXT_BUCKET_NAME,
-                processed_s3_key,
-                extracted_text
-            )
-            logger.info(f"--- Successfully processed book ID: {book_id} ---")
-            
-        except FileNotFoundError as fnfe:
-            # S3에서 파일을 찾지 못한 경우
-            handle_processing_error(book_id, file_key, f"File not found: {fnfe}")
-            overall_status['statusCode'] = 202 # 일부 실패 의미
-        except ValueError as ve: 
-            # 지원하지 않는 파일 형식 등 예상된 입력 오류
-            handle_processing_error(book_id, file_key, f"Data validation error: {ve}")
-            overall_status['statusCode'] = 202
-        except Exception as e:
-            # 기타 예상치 못한 오류
-            handle_processing_error(book_id, file_key, f"An unexpected error occurred during processing: {e}")
-            overall_status['statusCode'] = 500 # 심각한 오류
-        
-        # 각 레코드 처리 후 다음 레코드로 넘어감 (continue는 try 블록 안에서만 동작)
+    status_lock = threading.Lock()
+
+    def _record_failure(status_code):
+        # 병렬 처리 중 상태 코드 갱신 (500 > 202 > 200 우선순위 유지)
+        with status_lock:
+            overall_status['statusCode'] = max(overall_status['statusCode'], status_code)
+
+    records = event['Records']
+
+    # BatchWriteItem으로 여러 레코드의 put을 HTTP 호출 1번(최대 25건)에 묶습니다.
+    # (25건 초과 분할과 UnprocessedItems 재시도는 boto3 batch_writer가 처리)
+    with book_meta_table.batch_writer(overwrite_by_pkeys=['bookId']) as batch_writer:
+        # batch_writer는 스레드 안전하지 않으므로 put은 락으로 직렬화합니다.
+        writer_lock = threading.Lock()
+
+        def _process_record(record):
+            source_bucket_name = record['s3']['bucket']['name']
+            file_key = record['s3']['object']['key']
+            book_id = os.path.splitext(os.path.basename(file_key))[0] # 예: raw/my_book.pdf -> my_book
+
+            logger.info(f"--- Starting processing for book ID: {book_id} (File: {file_key}) ---")
+
+            try:
+                # 1. S3에서 파일 내용 다운로드 및 텍스트 추출
+                extracted_text = download_and_extract_text_from_s3(source_bucket_name, file_key)
+
+                # 추출 결과가 사실상 비어 있으면(스캔/이미지 전용 PDF 등)
+                # Bedrock 비용을 지불하지 않고 바로 실패 처리합니다.
+                if len(extracted_text.strip()) < MIN_EXTRACTED_TEXT_LENGTH:
+                    handle_processing_error(
+                        book_id, file_key,
+                        "Extracted text too short to analyze - likely an image-only PDF or empty file."
+                    )
+                    _record_failure(202)
+                    return
+
+                # .txt.gz: 압축 업로드이므로 소비자가 알 수 있도록 확장자에 반영
+                processed_s3_key = f"processed_texts/{book_id}.txt.gz"
+                with ThreadPoolExecutor(max_workers=1) as io_executor:
+                    # 2. 추출 텍스트 업로드는 Bedrock 출력과 무관하므로, 수 초가 걸리는
+                    # LLM 호출과 완전히 겹치도록 먼저 백그라운드로 제출합니다.
+                    upload_future = io_executor.submit(
+                        save_processed_text_to_s3,
+                        PROCESSED_TEXT_BUCKET_NAME,
+                        processed_s3_key,
+                        extracted_text
+                    )
+
+                    # 3. 노이즈 제거 후 Bedrock으로 텍스트 분석
+                    # (S3에는 원본 추출 텍스트를 그대로 보존)
+                    compressed_text = compress_book_text(extracted_text)
+                    book_analysis_data = analyze_book_with_bedrock(compressed_text, book_id)
+
+                    # 업로드 완료를 먼저 확인한 뒤에 메타데이터를 기록합니다.
+                    # (batch_writer의 put은 flush 시점까지 지연되므로, 업로드 실패 후에
+                    # PROCESSED 항목이 버퍼에 남아 있으면 flush가 FAILED 기록을 덮어씀)
+                    upload_future.result()  # 업로드 실패 시 예외를 그대로 전파
+
+                    # 4. DynamoDB에 메타데이터 저장
+                    with writer_lock:
+                        save_metadata_to_dynamodb(
+                            book_id,
+                            book_analysis_data,
+                            file_key,
+                            processed_s3_key,
+                            writer=batch_writer
+                        )
+                logger.info(f"--- Successfully processed book ID: {book_id} ---")
+
+            except FileNotFoundError as fnfe:
+                # S3에서 파일을 찾지 못한 경우
+                handle_processing_error(book_id, file_key, f"File not found: {fnfe}")
+                _record_failure(202) # 일부 실패 의미
+            except ValueError as ve:
+                # 지원하지 않는 파일 형식 등 예상된 입력 오류
+                handle_processing_error(book_id, file_key, f"Data validation error: {ve}")
+                _record_failure(202)
+            except Exception as e:
+                # 기타 예상치 못한 오류
+                handle_processing_error(book_id, file_key, f"An unexpected error occurred during processing: {e}")
+                _record_failure(500) # 심각한 오류
+
+        # S3 이벤트에 레코드가 여러 건이면 I/O 바운드 단계들을 병렬로 처리합니다.
+        if len(records) <= 1:
+            for record in records:
+                _process_record(record)
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(records), 10)) as executor:
+                futures = [executor.submit(_process_record, record) for record in records]
+                for future in as_completed(futures):
+                    future.result()  # _process_record가 예외를 자체 처리하므로 여기서는 방어적 확인
 
     return overall_status